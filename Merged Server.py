@@ -9,19 +9,25 @@ Usage: python merged_controller.py
 """
 
 import socket
+import sys
 import threading
 import time
-import re
 import keyboard
-import mouse
 import vgamepad
-import math
+import errno
 import logging
-import random
 import os
 import pyautogui
+import ctypes
+import ctypes.util
+import queue
+import selectors
+import heapq
+import itertools
+import contextlib
+import gc
 from datetime import datetime
-from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, MemoryHandler
 
 # Configure pyautogui for mouse handling
 pyautogui.FAILSAFE = False   # disable the top-left "panic" feature
@@ -37,16 +43,57 @@ os.makedirs(LOG_DIR, exist_ok=True)
 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
 log_file = os.path.join(LOG_DIR, f"controller_server_{timestamp}.log")
 
+# Records are handed to a background QueueListener so file/console I/O
+# never blocks the receive thread. Each run's file rolls over at
+# LOG_MAX_BYTES so a long session can't fill the disk. File records are
+# buffered and written LOG_BUFFER_RECORDS at a time; a warning or error
+# flushes the buffer at once, so problems still reach the file promptly.
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_BUFFER_RECORDS = 512
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+file_handler.setFormatter(log_formatter)
+file_buffer = MemoryHandler(LOG_BUFFER_RECORDS, flushLevel=logging.WARNING, target=file_handler)
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(log_formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, file_buffer, stream_handler)
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
+    format='%(message)s',   # final formatting happens in the listener's handlers
+    handlers=[QueueHandler(log_queue)]
 )
+log_listener.start()
 logger = logging.getLogger(__name__)
 
+# Cached INFO check for the per-event logs; call refresh_log_level() after
+# changing the log level at runtime
+INFO_ENABLED = logger.isEnabledFor(logging.INFO)
+
+def refresh_log_level():
+    """Re-read whether INFO records are enabled"""
+    global INFO_ENABLED
+    INFO_ENABLED = logger.isEnabledFor(logging.INFO)
+
+# Receive buffer sizes to try, largest first - the kernel may refuse (or
+# cap) big requests, and a tiny buffer drops datagrams during bursts
+RCVBUF_SIZES = (12 << 20, 4 << 20, 1 << 20, 256 << 10, 64 << 10, 4 << 10)
+SNDBUF_SIZE = 64 << 10
+
+def set_socket_buffers(sock):
+    """Apply the largest receive buffer the OS accepts and a 64 KiB send buffer"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SNDBUF_SIZE)
+    for size in RCVBUF_SIZES:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+            break
+        except OSError:
+            continue
+    return sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
 # Define low-latency socket function
 def setup_low_latency_socket(sock):
     """Configure socket for minimal latency with Windows compatibility"""
@@ -62,10 +109,8 @@ def setup_low_latency_socket(sock):
         
         # Try to set buffer sizes, but handle platform-specific issues
         try:
-            # Start with moderate buffer sizes that are more likely to be accepted
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
-            logger.info("Applied buffer size settings")
+            rcvbuf = set_socket_buffers(sock)
+            logger.info(f"Applied buffer size settings (SO_RCVBUF={rcvbuf})")
         except (socket.error, OSError) as e:
             logger.warning(f"Could not set socket buffer sizes: {str(e)}")
         
@@ -90,36 +135,150 @@ button_states = {
     'player2': {}
 }
 
-# Track which keys are currently pressed
+# Track which keys are currently pressed, as keyboard_key() codes so two
+# names for the same key share one entry (only player1 drives the keyboard)
 key_states = {
-    'player1': {},
-    'player2': {}
+    'player1': set(),
+    'player2': set()
 }
 
-# Track mouse states per player
-mouse_states = {
-    'player1': {'left_down': False, 'is_touchpad_active': False},
-    'player2': {'left_down': False, 'is_touchpad_active': False}
+class PlayerState:
+    """Per-player state - one slotted object instead of nested dicts"""
+    __slots__ = ('gamepad', 'buttons', 'dirty', 'log_count',
+                 'last_ls', 'last_rs', 'last_lt', 'last_rt')
+    
+    def __init__(self, gamepad, buttons):
+        self.gamepad = gamepad
+        self.buttons = buttons          # shares the player's button_states dict
+        self.dirty = False              # analog state changed, report not yet sent
+        self.log_count = 0              # stick samples since the last logged one
+        # Last analog values written to the pad, to skip unchanged samples
+        self.last_ls = (0.0, 0.0)
+        self.last_rs = (0.0, 0.0)
+        self.last_lt = 0.0
+        self.last_rt = 0.0
+
+# Track mouse/gamepad state per player
+player_states = {
+    player_id: PlayerState(gamepads[player_id], button_states[player_id])
+    for player_id in gamepads
 }
 
 # Track active connections
 active_connections = {}
 
+# XUSB button bits as plain ints, resolved once - vgamepad ORs them into the
+# report, so press_button()/release_button() need no enum unwrapping
+BTN_A = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_A)
+BTN_B = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_B)
+BTN_X = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_X)
+BTN_Y = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_Y)
+BTN_LEFT_SHOULDER = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_SHOULDER)
+BTN_RIGHT_SHOULDER = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_SHOULDER)
+BTN_START = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_START)
+BTN_BACK = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_BACK)
+BTN_DPAD_UP = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_UP)
+BTN_DPAD_DOWN = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_DOWN)
+BTN_DPAD_LEFT = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_LEFT)
+BTN_DPAD_RIGHT = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_RIGHT)
+BTN_LEFT_THUMB = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_THUMB)
+BTN_RIGHT_THUMB = int(vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB)
+
+# Xbox controller buttons - with shortened syntax; tapped buttons auto-release
+XBOX_BUTTONS_TAP = {
+    # Original syntax
+    "BUTTON_A_PRESSED": BTN_A,
+    "BUTTON_B_PRESSED": BTN_B,
+    "BUTTON_X_PRESSED": BTN_X,
+    "BUTTON_Y_PRESSED": BTN_Y,
+    "BUTTON_LB_PRESSED": BTN_LEFT_SHOULDER,
+    "BUTTON_RB_PRESSED": BTN_RIGHT_SHOULDER,
+    "BUTTON_START_PRESSED": BTN_START,
+    "BUTTON_BACK_PRESSED": BTN_BACK,
+    "BUTTON_DPAD_UP": BTN_DPAD_UP,
+    "BUTTON_DPAD_DOWN": BTN_DPAD_DOWN,
+    "BUTTON_DPAD_LEFT": BTN_DPAD_LEFT,
+    "BUTTON_DPAD_RIGHT": BTN_DPAD_RIGHT,
+    "BUTTON_LSTICK_PRESSED": BTN_LEFT_THUMB,
+    "BUTTON_RSTICK_PRESSED": BTN_RIGHT_THUMB,
+
+    # Shorter Xbox syntax
+    "X360A": BTN_A,
+    "X360B": BTN_B,
+    "X360X": BTN_X,
+    "X360Y": BTN_Y,
+    "X360LB": BTN_LEFT_SHOULDER,
+    "X360RB": BTN_RIGHT_SHOULDER,
+    "X360START": BTN_START,
+    "X360BACK": BTN_BACK,
+    "X360UP": BTN_DPAD_UP,
+    "X360DOWN": BTN_DPAD_DOWN,
+    "X360LEFT": BTN_DPAD_LEFT,
+    "X360RIGHT": BTN_DPAD_RIGHT,
+    "X360LS": BTN_LEFT_THUMB,
+    "X360RS": BTN_RIGHT_THUMB,
+}
+
+# HOLD versions (without auto-release)
+XBOX_BUTTONS_HOLD = {
+    "X360A_HOLD": BTN_A,
+    "X360B_HOLD": BTN_B,
+    "X360X_HOLD": BTN_X,
+    "X360Y_HOLD": BTN_Y,
+    "X360LB_HOLD": BTN_LEFT_SHOULDER,
+    "X360RB_HOLD": BTN_RIGHT_SHOULDER,
+    "X360START_HOLD": BTN_START,
+    "X360BACK_HOLD": BTN_BACK,
+    "X360UP_HOLD": BTN_DPAD_UP,
+    "X360DOWN_HOLD": BTN_DPAD_DOWN,
+    "X360LEFT_HOLD": BTN_DPAD_LEFT,
+    "X360RIGHT_HOLD": BTN_DPAD_RIGHT,
+    "X360LS_HOLD": BTN_LEFT_THUMB,
+    "X360RS_HOLD": BTN_RIGHT_THUMB,
+}
+
+# Every Xbox press command -> (button, auto_release), so a press costs one probe
+XBOX_BUTTON_PRESSES = {name: (btn, True) for name, btn in XBOX_BUTTONS_TAP.items()}
+XBOX_BUTTON_PRESSES.update((name, (btn, False)) for name, btn in XBOX_BUTTONS_HOLD.items())
+
+# Xbox button release commands (explicit releases from the app)
+XBOX_BUTTONS_RELEASE = {
+    "BUTTON_A_RELEASED": BTN_A,
+    "BUTTON_B_RELEASED": BTN_B,
+    # ... other original release commands ...
+    
+    # Release commands for shortened names
+    "X360A_RELEASE": BTN_A,
+    "X360B_RELEASE": BTN_B,
+    "X360X_RELEASE": BTN_X,
+    "X360Y_RELEASE": BTN_Y,
+    "X360LB_RELEASE": BTN_LEFT_SHOULDER,
+    "X360RB_RELEASE": BTN_RIGHT_SHOULDER,
+    "X360START_RELEASE": BTN_START,
+    "X360BACK_RELEASE": BTN_BACK,
+    "X360UP_RELEASE": BTN_DPAD_UP,
+    "X360DOWN_RELEASE": BTN_DPAD_DOWN,
+    "X360LEFT_RELEASE": BTN_DPAD_LEFT,
+    "X360RIGHT_RELEASE": BTN_DPAD_RIGHT,
+    "X360LS_RELEASE": BTN_LEFT_THUMB,
+    "X360RS_RELEASE": BTN_RIGHT_THUMB,
+}
+
+# A fast drag hits the speed limit on most samples; log only the first of
+# every LARGE_MOVE_LOG_MASK + 1 large movements so the warning can't flood
+LARGE_MOVE_LOG_MASK = 31
+
 class StabilitySmoother:
     """Mouse movement smoother focused on stability over responsiveness"""
     def __init__(self):
-        # Longer buffer for stronger smoothing
-        self.buffer_size = 5
-        self.x_buffer = deque([0.0] * self.buffer_size, maxlen=self.buffer_size)
-        self.y_buffer = deque([0.0] * self.buffer_size, maxlen=self.buffer_size)
-        
-        # State tracking
+        # State tracking - smoothing is a scalar EMA held in last_dx/last_dy
         self.prev_x = 0.0
         self.prev_y = 0.0
         self.last_dx = 0.0
         self.last_dy = 0.0
-        self.last_time = time.time()
+        self.last_time = time.perf_counter()
         self.frame_count = 0
+        self.large_moves = 0           # large movements seen, for log sampling
         self.touch_active = False
         
         # Adjustable parameters - set conservative defaults
@@ -130,12 +289,10 @@ class StabilitySmoother:
         
     def reset(self):
         """Reset the smoother state for a new touch sequence"""
-        self.x_buffer = deque([0.0] * self.buffer_size, maxlen=self.buffer_size)
-        self.y_buffer = deque([0.0] * self.buffer_size, maxlen=self.buffer_size)
         self.last_dx = 0.0
         self.last_dy = 0.0
         self.frame_count = 0
-        self.last_time = time.time()
+        self.last_time = time.perf_counter()
         self.touch_active = True
         logger.info("Smoother reset for new touch")
         
@@ -170,7 +327,7 @@ class StabilitySmoother:
             return (0, 0)
             
         # Calculate time delta
-        now = time.time()
+        now = time.perf_counter()
         dt = now - self.last_time
         self.last_time = now
         
@@ -185,27 +342,28 @@ class StabilitySmoother:
         self.prev_x = x
         self.prev_y = y
         
-        # Skip tiny movements (deadzone)
-        if abs(delta_x) < self.deadzone and abs(delta_y) < self.deadzone:
+        # Skip tiny movements (deadzone) - parameters are read into locals
+        # once, and comparisons replace abs()/min() calls in the math below
+        deadzone = self.deadzone
+        if -deadzone < delta_x < deadzone and -deadzone < delta_y < deadzone:
             return (0, 0)
             
-        # Add to smoothing buffer
-        self.x_buffer.append(delta_x)
-        self.y_buffer.append(delta_y)
-        
         # Determine smoothing factor based on context
         # More smoothing for first few frames to eliminate initial jump
         effective_smoothing = self.smoothing_factor
         if self.frame_count < 5:
-            effective_smoothing = min(0.9, self.smoothing_factor + 0.2)
+            effective_smoothing += 0.2
             
         # More smoothing for very rapid updates (potential jitter)
         if dt < 0.010:  # Less than 10ms
-            effective_smoothing = min(0.9, effective_smoothing + 0.1)
+            effective_smoothing += 0.1
+        if effective_smoothing > 0.9:
+            effective_smoothing = 0.9
             
         # Apply exponential smoothing
-        smoothed_dx = delta_x * (1 - effective_smoothing) + self.last_dx * effective_smoothing
-        smoothed_dy = delta_y * (1 - effective_smoothing) + self.last_dy * effective_smoothing
+        keep = 1 - effective_smoothing
+        smoothed_dx = delta_x * keep + self.last_dx * effective_smoothing
+        smoothed_dy = delta_y * keep + self.last_dy * effective_smoothing
         
         # Store for next iteration
         self.last_dx = smoothed_dx
@@ -213,35 +371,53 @@ class StabilitySmoother:
         
         # Linear sensitivity with no boost for small movements
         # This is more predictable and less jumpy
-        scaled_dx = smoothed_dx * self.sensitivity
-        scaled_dy = smoothed_dy * self.sensitivity
+        sensitivity = self.sensitivity
+        scaled_dx = smoothed_dx * sensitivity
+        scaled_dy = smoothed_dy * sensitivity
         
         # Apply speed limiting to prevent large jumps
-        if abs(scaled_dx) > self.max_speed:
-            scaled_dx = self.max_speed if scaled_dx > 0 else -self.max_speed
+        max_speed = self.max_speed
+        if scaled_dx > max_speed:
+            scaled_dx = max_speed
+        elif scaled_dx < -max_speed:
+            scaled_dx = -max_speed
             
-        if abs(scaled_dy) > self.max_speed:
-            scaled_dy = self.max_speed if scaled_dy > 0 else -self.max_speed
+        if scaled_dy > max_speed:
+            scaled_dy = max_speed
+        elif scaled_dy < -max_speed:
+            scaled_dy = -max_speed
         
         # Convert to integers for mouse movement
         final_dx = int(scaled_dx)
         final_dy = int(scaled_dy)
         
         # Ensure small intentional movements aren't lost
-        if abs(smoothed_dx) > self.deadzone*2 and final_dx == 0:
-            final_dx = 1 if smoothed_dx > 0 else -1
+        threshold = deadzone * 2
+        if final_dx == 0:
+            if smoothed_dx > threshold:
+                final_dx = 1
+            elif smoothed_dx < -threshold:
+                final_dx = -1
             
-        if abs(smoothed_dy) > self.deadzone*2 and final_dy == 0:
-            final_dy = 1 if smoothed_dy > 0 else -1
+        if final_dy == 0:
+            if smoothed_dy > threshold:
+                final_dy = 1
+            elif smoothed_dy < -threshold:
+                final_dy = -1
             
         # Log large movements for analysis
-        if abs(final_dx) > 10 or abs(final_dy) > 10:
-            logger.warning(f"Large movement: dx={final_dx}, dy={final_dy}, raw=({delta_x:.3f}, {delta_y:.3f})")
+        if not -10 <= final_dx <= 10 or not -10 <= final_dy <= 10:
+            count = self.large_moves
+            self.large_moves = count + 1
+            if not count & LARGE_MOVE_LOG_MASK:
+                logger.warning("Large movement: dx=%d, dy=%d, raw=(%.3f, %.3f) [%d total]",
+                               final_dx, final_dy, delta_x, delta_y, count + 1)
             
         return (final_dx, final_dy)
 
-# Global state
-smoother = StabilitySmoother()
+# One smoother per player - each client's touch positions are only
+# differenced against its own previous sample
+smoothers = {player_id: StabilitySmoother() for player_id in player_states}
 
 # Helper function for releasing Xbox buttons
 def release_xbox_button(button, player_id='player1'):
@@ -250,19 +426,100 @@ def release_xbox_button(button, player_id='player1'):
         if player_id in gamepads:
             gamepads[player_id].release_button(button=button)
             gamepads[player_id].update()
-            logger.info(f"{player_id} released button: {button}")
+            logger.info("%s released button: %s", player_id, button)
     except Exception as e:
         logger.error(f"Failed to release button for {player_id}: {str(e)}")
 
-# Helper functions
-def normalize_value(value):
-    """Convert string or float to normalized float (-1.0 to 1.0)"""
+# ---------------------------------------------------------------------------
+# Mouse output. On Windows, moves and button events go straight to user32;
+# elsewhere (and if user32 can't be loaded) pyautogui does the work.
+# Moves set the cursor position (GetCursorPos + SetCursorPos) like
+# pyautogui.moveRel does, rather than sending a relative SendInput move,
+# which Windows would scale by pointer speed and "Enhance pointer
+# precision" - DELTA_GAIN and the smoother are tuned for unaccelerated
+# pixels. Button events go through one preallocated SendInput record.
+# ---------------------------------------------------------------------------
+INPUT_MOUSE = 0
+
+# Mouse button command -> (pyautogui button, pressed, SendInput flag)
+MOUSE_BUTTON_COMMANDS = {
+    "MOUSE_LEFT_DOWN": ("left", True, 0x0002),
+    "MOUSE_LEFT_UP": ("left", False, 0x0004),
+    "MOUSE_RIGHT_DOWN": ("right", True, 0x0008),
+    "MOUSE_RIGHT_UP": ("right", False, 0x0010),
+    "MOUSE_MIDDLE_DOWN": ("middle", True, 0x0020),
+    "MOUSE_MIDDLE_UP": ("middle", False, 0x0040),
+}
+
+class MOUSEINPUT(ctypes.Structure):
+    _fields_ = [("dx", ctypes.c_int32), ("dy", ctypes.c_int32),
+                ("mouseData", ctypes.c_uint32), ("dwFlags", ctypes.c_uint32),
+                ("time", ctypes.c_uint32), ("dwExtraInfo", ctypes.c_size_t)]
+
+class INPUT(ctypes.Structure):
+    # MOUSEINPUT is the largest member of the Win32 INPUT union, so it
+    # alone gives the struct its real size
+    _fields_ = [("type", ctypes.c_uint32), ("mi", MOUSEINPUT)]
+
+class POINT(ctypes.Structure):
+    _fields_ = [("x", ctypes.c_int32), ("y", ctypes.c_int32)]
+
+def load_user32():
+    """Return user32's (SendInput, GetCursorPos, SetCursorPos), or None where unavailable"""
+    if sys.platform != "win32":
+        return None
     try:
-        return max(-1.0, min(1.0, float(value)))
-    except (ValueError, TypeError):
-        logger.error(f"Failed to convert value to float: {value}")
-        return 0.0
+        user32 = ctypes.WinDLL("user32")
+        send_input = user32.SendInput
+        get_cursor_pos = user32.GetCursorPos
+        set_cursor_pos = user32.SetCursorPos
+    except (OSError, AttributeError):
+        return None
+    send_input.argtypes = [ctypes.c_uint, ctypes.POINTER(INPUT), ctypes.c_int]
+    send_input.restype = ctypes.c_uint
+    get_cursor_pos.argtypes = [ctypes.POINTER(POINT)]
+    get_cursor_pos.restype = ctypes.c_int
+    set_cursor_pos.argtypes = [ctypes.c_int, ctypes.c_int]
+    set_cursor_pos.restype = ctypes.c_int
+    return send_input, get_cursor_pos, set_cursor_pos
 
+user32_mouse = load_user32()
+
+if user32_mouse is not None:
+    send_input, get_cursor_pos, set_cursor_pos = user32_mouse
+    mouse_input = INPUT(type=INPUT_MOUSE)
+    mouse_input_ref = ctypes.byref(mouse_input)
+    mouse_input_size = ctypes.sizeof(INPUT)
+    cursor_pos = POINT()
+    cursor_pos_ref = ctypes.byref(cursor_pos)
+    # Both players' input threads share the records
+    mouse_input_lock = threading.Lock()
+    
+    def move_mouse_rel(dx, dy):
+        """Move the cursor by dx, dy pixels"""
+        with mouse_input_lock:
+            if get_cursor_pos(cursor_pos_ref):
+                set_cursor_pos(cursor_pos.x + dx, cursor_pos.y + dy)
+    
+    def press_mouse_button(button, pressed, flag):
+        """Send one mouse button down/up event"""
+        with mouse_input_lock:
+            mi = mouse_input.mi
+            mi.dx = 0
+            mi.dy = 0
+            mi.dwFlags = flag
+            send_input(1, mouse_input_ref, mouse_input_size)
+else:
+    move_mouse_rel = pyautogui.moveRel
+    
+    def press_mouse_button(button, pressed, flag):
+        """Send one mouse button down/up event"""
+        if pressed:
+            pyautogui.mouseDown(button=button)
+        else:
+            pyautogui.mouseUp(button=button)
+
+# Helper functions
 def parse_float(value):
     """Parse a float without clamping, returning 0.0 on error"""
     try:
@@ -271,55 +528,91 @@ def parse_float(value):
         logger.error(f"Failed to convert value: {value}")
         return 0.0
 
-def handle_touchpad(command):
-    """Handle touchpad input with stability smoother from first file"""
-    # ---------- quick DELTA path ----------
-    if command.startswith("DELTA:"):
-        try:
-            dx, dy = map(float, command[6:].split(",", 1))
-            mx = int(dx * DELTA_GAIN)
-            my = int(dy * DELTA_GAIN)
-            print("HDL", dx, dy, "⇒", mx, my)      # DEBUG
-            # comment-out the line you're NOT using:
-            # mouse.move(mx, my, absolute=False)   # needs admin
-            pyautogui.moveRel(mx, my)              # works without admin
-        except ValueError:
-            logger.warning(f"Bad DELTA packet: {command}")
-        return                                     # ← don't let it fall through
-    # ---------------------------------------
+def parse_coords(coords):
+    """Parse an "x,y" payload into a float pair in one pass, or None if malformed"""
+    x, _, y = coords.partition(",")
+    try:
+        return float(x), float(y)
+    except ValueError:
+        return None
 
-    # From here down you're dealing with absolute-position packets
-    # (TOUCHPAD: / POS:) if you ever decide to keep them.
+def parse_position(coords):
+    """Parse an "x,y" payload clamped to -1.0..1.0, or None if malformed"""
+    x, _, y = coords.partition(",")
     try:
-        _, coords = command.split(":", 1)        # coords is now defined
-        x, y = coords.split(",", 1)
-        x_val = normalize_value(x)
-        y_val = normalize_value(y)
-        dx, dy = smoother.process_movement(x_val, y_val)
+        x = float(x)
+        y = float(y)
+    except ValueError:
+        return None
+    # Inline clamps - cheaper than max(min()) on the per-sample path
+    x = -1.0 if x < -1.0 else 1.0 if x > 1.0 else x
+    y = -1.0 if y < -1.0 else 1.0 if y > 1.0 else y
+    return x, y
+
+# Relative cursor motion is summed while a command worker drains its batch
+# and sent as one move_mouse_rel call when the batch ends, so a backlog of
+# touchpad samples costs one move instead of one per packet. Mouse buttons
+# flush first, so clicks land where the cursor was sent. Only whole pixels are
+# sent; the fractional remainder carries over, so slow drags that move
+# less than a pixel per packet still add up instead of being truncated.
+pending_mouse_move = [0.0, 0.0]
+pending_mouse_lock = threading.Lock()
+
+def queue_mouse_move(dx, dy):
+    """Add dx, dy pixels (may be fractional) to the pending cursor move"""
+    with pending_mouse_lock:
+        pending_mouse_move[0] += dx
+        pending_mouse_move[1] += dy
+
+def flush_mouse_move():
+    """Send the whole-pixel part of the pending cursor move, if any"""
+    with pending_mouse_lock:
+        x, y = pending_mouse_move
+        dx = int(x)
+        dy = int(y)
+        pending_mouse_move[0] = x - dx
+        pending_mouse_move[1] = y - dy
+    if dx or dy:
+        move_mouse_rel(dx, dy)
+
+def move_mouse_delta(dx, dy):
+    """Move the cursor by a relative touchpad delta"""
+    mx = dx * DELTA_GAIN
+    my = dy * DELTA_GAIN
+    logger.debug("DELTA %s,%s => %.2f,%.2f", dx, dy, mx, my)
+    queue_mouse_move(mx, my)
+
+def delta_command(data, value, player_id):
+    delta = parse_coords(value)
+    if delta is None:
+        logger.warning(f"Bad DELTA packet: {data}")
+        return
+    move_mouse_delta(*delta)
+
+def handle_touchpad_position(x, y, player_id='player1'):
+    """Feed an absolute touchpad position (floats, already clamped) to the player's smoother"""
+    try:
+        dx, dy = smoothers[player_id].process_movement(x, y)
         if dx or dy:
-            pyautogui.moveRel(dx, dy) 
+            queue_mouse_move(dx, dy)
     except Exception as e:
         logger.error(f"Error handling touchpad input: {e}")
 
-def handle_mouse_buttons(command):
+def touchpad_position_command(data, value, player_id):
+    position = parse_position(value)
+    if position is None:
+        logger.warning(f"Bad touchpad packet: {data}")
+        return
+    handle_touchpad_position(position[0], position[1], player_id)
+
+def handle_mouse_buttons(command, player_id='player1'):
     try:
-        if command == "MOUSE_LEFT_DOWN":
-            pyautogui.mouseDown(button="left")
-        elif command == "MOUSE_LEFT_UP":
-            pyautogui.mouseUp(button="left")
-
-        elif command == "MOUSE_RIGHT_DOWN":          # NEW
-            pyautogui.mouseDown(button="right")
-        elif command == "MOUSE_RIGHT_UP":            # NEW
-            pyautogui.mouseUp(button="right")
-            
-        elif command == "MOUSE_MIDDLE_DOWN":
-            pyautogui.mouseDown(button="middle")
-        elif command == "MOUSE_MIDDLE_UP":
-            pyautogui.mouseUp(button="middle")
-            
+        flush_mouse_move()
+        button = MOUSE_BUTTON_COMMANDS.get(command)
+        if button is not None:
+            press_mouse_button(*button)
         elif command in ("TOUCHPAD_END", "TOUCH_END"):
-            smoother.end_touch()
+            smoothers[player_id].end_touch()
         elif command == "MOUSE_RESET":
             logger.warning("MOUSE_RESET ignored to prevent jumps")
     except Exception as e:
@@ -328,73 +621,170 @@ def handle_mouse_buttons(command):
 def handle_scroll(command):
     # SCROLL:+/-n   → one notch ≈ 120 units on Windows
     try:
+        flush_mouse_move()          # scroll where the cursor was sent
         amount = int(float(command.split(":",1)[1]) * 120)
         pyautogui.scroll(amount)
     except Exception as e:
         logger.error(f"Bad SCROLL packet {command}: {e}")        
 
+# Stick/trigger samples only write the gamepad's report; one updater thread
+# sends it (gamepad.update(), a ViGEmBus IOCTL) at most once per
+# GAMEPAD_UPDATE_INTERVAL per player, so a burst of samples costs one call
+GAMEPAD_UPDATE_INTERVAL = 0.002
+STICK_LOG_MASK = 31
+# One step of the XInput report: sticks are 16-bit, triggers 8-bit
+STICK_EPSILON = 1.0 / 32767
+TRIGGER_EPSILON = 1.0 / 255
+gamepad_update_cv = threading.Condition()
+
+def mark_gamepad_dirty(state):
+    """Queue a report update for a player's gamepad"""
+    with gamepad_update_cv:
+        state.dirty = True
+        gamepad_update_cv.notify()
+
+def gamepad_updater():
+    """Send coalesced gamepad reports for players with pending analog changes"""
+    states = tuple(player_states.values())
+    while True:
+        with gamepad_update_cv:
+            while not any(state.dirty for state in states):
+                gamepad_update_cv.wait()
+        time.sleep(GAMEPAD_UPDATE_INTERVAL)     # let the rest of the burst land
+        with gamepad_update_cv:
+            pending = [state for state in states if state.dirty]
+            for state in pending:
+                state.dirty = False
+        for state in pending:
+            try:
+                state.gamepad.update()
+            except Exception as e:
+                logger.error(f"Gamepad update failed: {e}")
+
+def flush_gamepad_reports():
+    """Send any pending analog reports now instead of waiting for the updater"""
+    with gamepad_update_cv:
+        pending = [state for state in player_states.values() if state.dirty]
+        for state in pending:
+            state.dirty = False
+    for state in pending:
+        state.gamepad.update()
+
+gamepad_update_thread = threading.Thread(target=gamepad_updater, name="gamepad-update", daemon=True)
+gamepad_update_thread.start()
+
 def handle_stick_input(x, y, stick_type="LEFT", player_id='player1'):
-    """Handle analog stick input with improved handling"""
-    x = normalize_value(x)
-    y = normalize_value(y)
+    """Handle analog stick input with improved handling (x, y are floats)"""
+    # No try/except here: callers pass floats, and a vgamepad failure
+    # propagates to the command worker / scheduler, which log it
+    x = -1.0 if x < -1.0 else 1.0 if x > 1.0 else x
+    y = -1.0 if y < -1.0 else 1.0 if y > 1.0 else y
     
     # Apply deadzone if very close to center
-    if abs(x) < 0.05 and abs(y) < 0.05:
-        x, y = 0, 0
+    if -0.05 < x < 0.05 and -0.05 < y < 0.05:
+        x, y = 0.0, 0.0
     
-    try:
-        if player_id not in gamepads:
-            logger.error(f"Unknown player ID: {player_id}")
-            return
-            
-        gamepad = gamepads[player_id]
-        
-        if stick_type == "LEFT":
-            gamepad.left_joystick_float(x_value_float=x, y_value_float=-y)  # Y is inverted for gamepad
-        else:
-            gamepad.right_joystick_float(x_value_float=x, y_value_float=-y)  # Y is inverted for gamepad
-        
-        gamepad.update()
-        logger.info(f"{player_id} Stick {stick_type}: x={x:.2f}, y={y:.2f}")
-    except Exception as e:
-        logger.error(f"Error handling stick input for {player_id}: {str(e)}")
+    state = player_states.get(player_id)
+    if state is None:
+        logger.error(f"Unknown player ID: {player_id}")
+        return
+    
+    # A held stick keeps streaming the same position - skip samples
+    # that move less than one driver step on both axes
+    left = stick_type == "LEFT"
+    last_x, last_y = state.last_ls if left else state.last_rs
+    if -STICK_EPSILON < x - last_x < STICK_EPSILON and -STICK_EPSILON < y - last_y < STICK_EPSILON:
+        return
+    
+    gamepad = state.gamepad
+    
+    if left:
+        gamepad.left_joystick_float(x_value_float=x, y_value_float=-y)  # Y is inverted for gamepad
+        state.last_ls = (x, y)
+    else:
+        gamepad.right_joystick_float(x_value_float=x, y_value_float=-y)  # Y is inverted for gamepad
+        state.last_rs = (x, y)
+    
+    mark_gamepad_dirty(state)
+    # Sticks stream at the client's sample rate - log one sample in
+    # STICK_LOG_MASK + 1
+    count = (state.log_count + 1) & STICK_LOG_MASK
+    state.log_count = count
+    if not count and INFO_ENABLED:
+        logger.info("%s Stick %s: x=%.2f, y=%.2f", player_id, stick_type, x, y)
 
 def handle_trigger_input(value, trigger="LEFT", player_id='player1'):
-    """Handle analog trigger input (0.0 to 1.0)"""
-    try:
-        value = normalize_value(value)
-        # Ensure value is between 0 and 1 for triggers
-        value = max(0.0, min(1.0, value))
-        
-        if player_id not in gamepads:
-            logger.error(f"Unknown player ID: {player_id}")
+    """Handle analog trigger input (value is a float, 0.0 to 1.0)"""
+    # Ensure value is between 0 and 1 for triggers
+    value = 0.0 if value < 0.0 else 1.0 if value > 1.0 else value
+    
+    state = player_states.get(player_id)
+    if state is None:
+        logger.error(f"Unknown player ID: {player_id}")
+        return
+    
+    gamepad = state.gamepad
+    
+    if trigger == "LEFT":
+        if -TRIGGER_EPSILON < value - state.last_lt < TRIGGER_EPSILON:
             return
-            
-        gamepad = gamepads[player_id]
-        
-        if trigger == "LEFT":
-            gamepad.left_trigger_float(value_float=value)
-            logger.info(f"{player_id} Left trigger: {value:.2f}")
-        else:
-            gamepad.right_trigger_float(value_float=value)
-            logger.info(f"{player_id} Right trigger: {value:.2f}")
-        
-        gamepad.update()
-    except Exception as e:
-        logger.error(f"Error handling trigger input for {player_id}: {str(e)}")
+        gamepad.left_trigger_float(value_float=value)
+        state.last_lt = value
+        side = "Left"
+    else:
+        if -TRIGGER_EPSILON < value - state.last_rt < TRIGGER_EPSILON:
+            return
+        gamepad.right_trigger_float(value_float=value)
+        state.last_rt = value
+        side = "Right"
+    
+    mark_gamepad_dirty(state)
+    if INFO_ENABLED:
+        logger.info("%s %s trigger: %.2f", player_id, side, value)
 
-def handle_wait_command(command, player_id='player1'):
-    """Handle a wait command"""
+def parse_wait_ms(command, player_id='player1'):
+    """Milliseconds from a WAIT_X command, or None if malformed"""
     try:
-        # Extract milliseconds from WAIT_X command
-        wait_ms = int(command.split("_")[1])
-        # Sleep for the specified time
-        time.sleep(wait_ms / 1000.0)
-        logger.info(f"{player_id} waited for {wait_ms}ms")
-        return True
+        return int(command.split("_")[1])
     except (ValueError, IndexError) as e:
         logger.error(f"Invalid wait command from {player_id}: {command} - {str(e)}")
+        return None
+
+def handle_wait_command(command, player_id='player1'):
+    """Handle a wait command"""
+    # Extract milliseconds from WAIT_X command
+    wait_ms = parse_wait_ms(command, player_id)
+    if wait_ms is None:
         return False
+    # Make the pre-wait stick/trigger state visible before blocking
+    flush_gamepad_reports()
+    # Sleep for the specified time
+    time.sleep(wait_ms / 1000.0)
+    logger.info("%s waited for %dms", player_id, wait_ms)
+    return True
+
+# Wire key name -> what's passed to the keyboard module. Given a name,
+# keyboard re-parses it as a hotkey and looks it up in the OS key map on
+# every press; given a scan code it sends it directly, so each name is
+# resolved once. Names that don't map to a single key (e.g. "ctrl+c") are
+# passed through lowercased. Cleared if it ever grows past
+# KEY_CODE_CACHE_MAX (garbage input).
+KEY_CODE_CACHE_MAX = 1024
+key_code_cache = {}
+
+def keyboard_key(key):
+    """Scan code (or lowercased name) for a command key, cached"""
+    code = key_code_cache.get(key)
+    if code is None:
+        if len(key_code_cache) >= KEY_CODE_CACHE_MAX:
+            key_code_cache.clear()
+        name = key.lower()
+        try:
+            code = keyboard.key_to_scan_codes(name)[0]
+        except ValueError:
+            code = name
+        key_code_cache[key] = code
+    return code
 
 def handle_key_press(key, player_id='player1'):
     """Handle a directional key press with state tracking"""
@@ -404,38 +794,142 @@ def handle_key_press(key, player_id='player1'):
         return                 # ← nothing to do
 
     if player_id not in key_states:
-        key_states[player_id] = {}
+        key_states[player_id] = set()
 
-    key_states[player_id][key] = True
-    logger.info(f"{player_id} Key press: {key}")
+    key_code = keyboard_key(key)
+    key_states[player_id].add(key_code)
+    if INFO_ENABLED:
+        logger.info("%s Key press: %s", player_id, key)
 
     if player_id == 'player1':
         try:
-            keyboard.press(key.lower())
+            keyboard.press(key_code)
         except Exception as e:
             logger.error(f"Failed to press key {key}: {str(e)}")
 
 def handle_key_release(key, player_id='player1'):
     """Handle a directional key release with state tracking"""
     if player_id not in key_states:
-        key_states[player_id] = {}
+        key_states[player_id] = set()
     
     # Mark this key as released in our state tracker
-    if key in key_states[player_id]:
-        del key_states[player_id][key]
+    key_code = keyboard_key(key)
+    key_states[player_id].discard(key_code)
     
-    logger.info(f"{player_id} Key release: {key}")
+    if INFO_ENABLED:
+        logger.info("%s Key release: %s", player_id, key)
     
     # Release key (only player1 controls keyboard)
     if player_id == 'player1':
         try:
-            keyboard.release(key.lower())
+            keyboard.release(key_code)
         except Exception as e:
             logger.error(f"Failed to release key {key}: {str(e)}")
 
+# Timer scheduler: auto-releases and the waits inside command sequences run
+# on one worker thread that sleeps until the earliest deadline on a heap of
+# (due_time, order, func, args), instead of a thread per tap or sequence
+timer_heap = []
+timer_cv = threading.Condition()
+timer_order = itertools.count()         # FIFO tie-break for equal deadlines
+
+def schedule(delay, func, *args):
+    """Call func(*args) on the scheduler thread after delay seconds"""
+    with timer_cv:
+        heapq.heappush(timer_heap, (time.monotonic() + delay, next(timer_order), func, args))
+        timer_cv.notify()
+
+def schedule_release(button, player_id, delay=0.1):
+    """Release a tapped Xbox button after delay seconds"""
+    schedule(delay, release_tapped_button, button, player_id)
+
+def release_tapped_button(button, player_id):
+    state = player_states[player_id]
+    try:
+        flush_button_edge(state, button)
+        state.gamepad.release_button(button=button)
+        send_report(state, button)
+    except Exception as e:
+        logger.error(f"Auto‑release failed for {player_id}: {e}")
+    finally:
+        # make sure our local state is cleared
+        state.buttons[button] = False
+
+def timer_worker():
+    """Pop and run scheduled calls as their deadlines come due"""
+    while True:
+        with timer_cv:
+            while True:
+                if not timer_heap:
+                    timer_cv.wait()
+                    continue
+                wait = timer_heap[0][0] - time.monotonic()
+                if wait <= 0:
+                    break
+                timer_cv.wait(wait)
+            # Take every call that is due, so releases that fall due
+            # together share one gamepad report
+            now = time.monotonic()
+            due = []
+            while timer_heap and timer_heap[0][0] <= now:
+                due.append(heapq.heappop(timer_heap))
+        with batched_reports():
+            for _, _, func, args in due:
+                try:
+                    func(*args)
+                except Exception as e:
+                    logger.error(f"Scheduled call {func.__name__} failed: {e}")
+
+timer_thread = threading.Thread(target=timer_worker, name="scheduler", daemon=True)
+timer_thread.start()
+
+# Button reports sent while a command sequence runs are held per thread and
+# sent once per player when the run ends (or reaches a WAIT_ step), so
+# "A,B,X360LB" costs one gamepad.update() instead of three. The batch maps
+# each player to the buttons changed since its last send; a button changing
+# again first sends the held report, so "A_HOLD,B,A_RELEASE" or "A,A" still
+# reports every press and release.
+report_batch = threading.local()
+
+def flush_button_edge(state, button):
+    """Send the held report now if button already changed in the current batch"""
+    pending = getattr(report_batch, "pending", None)
+    if pending is not None and pending.get(state, 0) & button:
+        state.gamepad.update()
+        pending[state] = 0
+
+def send_report(state, button):
+    """Send the player's gamepad report now, or at the end of the current batch"""
+    pending = getattr(report_batch, "pending", None)
+    if pending is None:
+        state.gamepad.update()
+    else:
+        pending[state] = pending.get(state, 0) | button
+
+@contextlib.contextmanager
+def batched_reports():
+    """Defer send_report() calls on this thread until the block exits"""
+    if getattr(report_batch, "pending", None) is not None:
+        yield                       # nested - the outer batch sends
+        return
+    report_batch.pending = pending = {}
+    try:
+        yield
+    finally:
+        report_batch.pending = None
+        for state in pending:
+            state.gamepad.update()
+
+# Gamepad/mouse-style commands that missed the button tables (e.g. a typo'd
+# X360 name) - these are never key names, so they're rejected instead of
+# being handed to the keyboard module
+NON_KEY_PREFIXES = ("X360", "BUTTON_", "MOUSE_", "LS_", "RS_", "LT:", "RT:",
+                    "TRIGGER_", "STICK", "TOUCHPAD", "POS:")
+
 def handle_button_press(command, player_id='player1'):
     """Handle various button commands with proper release handling"""
-    if player_id not in mouse_states or player_id not in gamepads:
+    state = player_states.get(player_id)
+    if state is None:
         logger.error(f"Unknown player ID: {player_id}")
         return False
 
@@ -444,8 +938,7 @@ def handle_button_press(command, player_id='player1'):
         return True            # do nothing, report handled
     # ----------------------------------------------------------------
 
-    mouse_state = mouse_states[player_id]
-    gamepad = gamepads[player_id]
+    gamepad = state.gamepad
 
     # ----- key commands (reliable protocol) -----
     if command.startswith("KEY_DOWN:"):
@@ -468,352 +961,243 @@ def handle_button_press(command, player_id='player1'):
     
     # Process special commands - Use mouse button handling from first file
     if command == "MOUSE_LEFT_DOWN":
-        handle_mouse_buttons(command)
-        if player_id in mouse_states:
-            mouse_states[player_id]['left_down'] = True
+        handle_mouse_buttons(command, player_id)
         return True
     
     if command == "MOUSE_LEFT_UP":
-        handle_mouse_buttons(command)
-        if player_id in mouse_states:
-            mouse_states[player_id]['left_down'] = False
+        handle_mouse_buttons(command, player_id)
         return True
     
-    # Xbox controller buttons - with shortened syntax
-    xbox_buttons = {
-        # Original syntax
-        "BUTTON_A_PRESSED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_A,
-        "BUTTON_B_PRESSED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_B,
-        "BUTTON_X_PRESSED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_X,
-        "BUTTON_Y_PRESSED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_Y,
-        "BUTTON_LB_PRESSED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_SHOULDER,
-        "BUTTON_RB_PRESSED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_SHOULDER,
-        "BUTTON_START_PRESSED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_START,
-        "BUTTON_BACK_PRESSED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_BACK,
-        "BUTTON_DPAD_UP": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_UP,
-        "BUTTON_DPAD_DOWN": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_DOWN,
-        "BUTTON_DPAD_LEFT": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_LEFT,
-        "BUTTON_DPAD_RIGHT": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_RIGHT,
-        "BUTTON_LSTICK_PRESSED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_THUMB,
-        "BUTTON_RSTICK_PRESSED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB,
-        
-        # Shorter Xbox syntax
-        "X360A": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_A,
-        "X360B": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_B,
-        "X360X": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_X,
-        "X360Y": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_Y,
-        "X360LB": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_SHOULDER,
-        "X360RB": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_SHOULDER,
-        "X360START": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_START,
-        "X360BACK": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_BACK,
-        "X360UP": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_UP,
-        "X360DOWN": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_DOWN,
-        "X360LEFT": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_LEFT,
-        "X360RIGHT": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_RIGHT,
-        "X360LS": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_THUMB,
-        "X360RS": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB,
-        
-        # HOLD versions (without auto-release)
-        "X360A_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_A,
-        "X360B_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_B,
-        "X360X_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_X,
-        "X360Y_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_Y,
-        "X360LB_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_SHOULDER,
-        "X360RB_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_SHOULDER,
-        "X360START_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_START,
-        "X360BACK_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_BACK,
-        "X360UP_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_UP,
-        "X360DOWN_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_DOWN,
-        "X360LEFT_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_LEFT,
-        "X360RIGHT_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_RIGHT,
-        "X360LS_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_THUMB,
-        "X360RS_HOLD": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB,
-    }
-
-    # Xbox button release commands
-    xbox_release_commands = {
-        "BUTTON_A_RELEASED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_A,
-        "BUTTON_B_RELEASED": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_B,
-        # ... other original release commands ...
-        
-        # Release commands for shortened names
-        "X360A_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_A,
-        "X360B_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_B,
-        "X360X_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_X,
-        "X360Y_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_Y,
-        "X360LB_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_SHOULDER,
-        "X360RB_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_SHOULDER,
-        "X360START_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_START,
-        "X360BACK_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_BACK,
-        "X360UP_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_UP,
-        "X360DOWN_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_DOWN,
-        "X360LEFT_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_LEFT,
-        "X360RIGHT_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_RIGHT,
-        "X360LS_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_THUMB,
-        "X360RS_RELEASE": vgamepad.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB,
-    }
-    
     # Handle explicit button releases if your app sends them
-    if command in xbox_release_commands:
-        btn = xbox_release_commands[command]
+    btn = XBOX_BUTTONS_RELEASE.get(command)
+    if btn is not None:
         try:
+            flush_button_edge(state, btn)
             gamepad.release_button(button=btn)
-            gamepad.update()
+            send_report(state, btn)
             # clear state
-            button_states.setdefault(player_id, {})[btn] = False
-            logger.info(f"{player_id} Xbox button explicitly released: {command}")
+            state.buttons[btn] = False
+            if INFO_ENABLED:
+                logger.info("%s Xbox button explicitly released: %s", player_id, command)
         except Exception as e:
             logger.error(f"Failed to release Xbox button for {player_id}: {str(e)}")
         return True
     
-    # Check if it's an Xbox button press
-    if command in xbox_buttons:
-        btn = xbox_buttons[command]
+    # Check if it's an Xbox button press (tap or HOLD) - one dict probe
+    press = XBOX_BUTTON_PRESSES.get(command)
+    if press is not None:
+        btn, auto_release = press
         try:
+            flush_button_edge(state, btn)
             # --- SAFETY: pre‑release if we think this button is still down ---
-            if button_states.get(player_id, {}).get(btn, False):
+            if state.buttons.get(btn, False):
                 gamepad.release_button(button=btn)
                 gamepad.update()
                 time.sleep(0.005)  # tiny settle
-                button_states[player_id][btn] = False
+                state.buttons[btn] = False
 
             # Press
             gamepad.press_button(button=btn)
-            gamepad.update()
+            send_report(state, btn)
             # mark down
-            button_states.setdefault(player_id, {})[btn] = True
-            logger.info(f"{player_id} Xbox button pressed: {command}")
+            state.buttons[btn] = True
+            if INFO_ENABLED:
+                logger.info("%s Xbox button pressed: %s", player_id, command)
 
             # Only auto‑release if not a HOLD command
-            if not command.endswith("_HOLD"):
-                def do_release():
-                    try:
-                        gamepad.release_button(button=btn)
-                        gamepad.update()
-                    except Exception as e:
-                        logger.error(f"Auto‑release failed for {player_id}: {e}")
-                    finally:
-                        # make sure our local state is cleared
-                        try:
-                            button_states[player_id][btn] = False
-                        except Exception:
-                            pass
-
-                release_timer = threading.Timer(0.1, do_release)
-                release_timer.daemon = True
-                release_timer.start()
-                logger.info(f"Scheduled auto-release for {player_id} {command}")
+            if auto_release:
+                schedule_release(btn, player_id)
+                logger.debug("Scheduled auto-release for %s %s", player_id, command)
             else:
-                logger.info(f"Hold mode - no auto-release for {player_id} {command}")
+                logger.debug("Hold mode - no auto-release for %s %s", player_id, command)
         except Exception as e:
             logger.error(f"Failed to press Xbox button for {player_id}: {str(e)}")
         return True
     
+    if command.startswith(NON_KEY_PREFIXES):
+        logger.warning(f"Unknown command from {player_id}: {command}")
+        return False
+    
     # Handle keyboard input (common keys)
     try:
         # Only player1 controls the keyboard to avoid conflicts
         if player_id == 'player1':
             # For regular keyboard presses (not through key state system)
-            keyboard.press_and_release(command.lower())
-            logger.info(f"{player_id} Keyboard key pressed: {command}")
+            keyboard.press_and_release(keyboard_key(command))
+            if INFO_ENABLED:
+                logger.info("%s Keyboard key pressed: %s", player_id, command)
         return True
     except Exception as e:
         logger.error(f"Failed to process command for {player_id}: {command} - {str(e)}")
         return False
 
-def process_timed_sequence(commands, player_id='player1'):
+def process_timed_sequence(commands, player_id='player1', start=0):
     """Process a sequence of commands with timing delays"""
+    # Runs up to the next WAIT_ step, then hands the rest of the sequence
+    # to the scheduler instead of sleeping. Button reports for the run are
+    # sent together when it ends.
     try:
-        for cmd in commands:
-            cmd = cmd.strip()
-            if cmd:  # Skip empty commands
-                # Process command and wait for completion
+        with batched_reports():
+            for i in range(start, len(commands)):
+                cmd = commands[i].strip()
+                if not cmd:  # Skip empty commands
+                    continue
+                if cmd.startswith("WAIT_"):
+                    wait_ms = parse_wait_ms(cmd, player_id)
+                    if wait_ms is not None:
+                        # Make the pre-wait stick/trigger state visible
+                        # before the pause, as a standalone WAIT_ does
+                        flush_gamepad_reports()
+                        schedule(wait_ms / 1000.0, process_timed_sequence, commands, player_id, i + 1)
+                        return
+                    continue
                 handle_button_press(cmd, player_id)
     except Exception as e:
         logger.error(f"Error in timed sequence for {player_id}: {str(e)}")
 
+# Replies go out as-is, so they're kept as bytes rather than encoded per send
+PONG_REPLY = b"PONG"
+INVALID_PLAYER_REPLY = b"ERROR:invalid_player_id"
+
+# CONNECT:/REGISTER: handshakes -> (response prefix, verb for the log)
+REGISTRATION_REPLIES = {
+    "CONNECT": ("CONNECTED", "connected"),
+    "REGISTER": ("REGISTERED", "registered"),
+}
+VALID_PLAYER_IDS = frozenset(('player1', 'player2'))
+
+def handle_registration(kind, requested_id, addr, conn):
+    """Bind a connection to the requested player for CONNECT:/REGISTER:"""
+    reply, verb = REGISTRATION_REPLIES[kind]
+    requested_id = requested_id.strip()
+    if requested_id in VALID_PLAYER_IDS:
+        conn['player_id'] = requested_id
+        logger.info("Client %s %s as %s", addr, verb, requested_id)
+        return f"{reply}:{requested_id}".encode()
+    logger.warning(f"Invalid player ID in {kind} request: {requested_id}")
+    return INVALID_PLAYER_REPLY
+
+# Prefixed "NAME:value" commands -> handler(data, value, player_id).
+# Anything with a colon that isn't listed here is a stick coordinate command.
+PREFIX_COMMANDS = {
+    "SCROLL": lambda data, value, player_id: handle_scroll(data),
+    "DELTA": delta_command,
+    "TOUCHPAD": touchpad_position_command,
+    "POS": touchpad_position_command,
+    # Ignore keep-alive packets so taps don't fire twice
+    "KEY_SYNC": lambda data, value, player_id: None,
+    # Key state tracking commands
+    "KEY_DOWN": lambda data, value, player_id: handle_key_press(value, player_id),
+    "KEY_UP": lambda data, value, player_id: handle_key_release(value, player_id),
+    # Trigger input - both original and shortened syntax
+    "TRIGGER_L": lambda data, value, player_id: handle_trigger_input(parse_float(value), "LEFT", player_id),
+    "TRIGGER_R": lambda data, value, player_id: handle_trigger_input(parse_float(value), "RIGHT", player_id),
+    "LT": lambda data, value, player_id: handle_trigger_input(parse_float(value), "LEFT", player_id),
+    "RT": lambda data, value, player_id: handle_trigger_input(parse_float(value), "RIGHT", player_id),
+}
+
+STICK_COMMANDS = {
+    "STICK": "LEFT", "STICK_L": "LEFT", "LS": "LEFT",
+    "STICK_R": "RIGHT", "RS": "RIGHT",
+}
+
+def stick_shortcut(x, y, stick_type):
+    """Handler for the fixed stick positions (LS_UP, RS_LEFT, ...)"""
+    return lambda data, player_id: handle_stick_input(x, y, stick_type, player_id)
+
+def mouse_button_command(data, player_id):
+    handle_mouse_buttons(data, player_id)
+
+# Exact-match commands -> handler(data, player_id); the return value is the reply
+EXACT_COMMANDS = {
+    "MOUSE_LEFT_DOWN": mouse_button_command,
+    "MOUSE_LEFT_UP": mouse_button_command,
+    "MOUSE_RIGHT_DOWN": mouse_button_command,
+    "MOUSE_RIGHT_UP": mouse_button_command,
+    "MOUSE_MIDDLE_DOWN": mouse_button_command,
+    "MOUSE_MIDDLE_UP": mouse_button_command,
+    "TOUCHPAD_END": mouse_button_command,
+    "TOUCH_END": mouse_button_command,
+    "MOUSE_RESET": mouse_button_command,
+    # Handle heartbeat messages
+    "PING": lambda data, player_id: PONG_REPLY,
+    # Shortened stick position shortcuts
+    "LS_UP": stick_shortcut(0.0, 1.0, "LEFT"),
+    "LS_DOWN": stick_shortcut(0.0, -1.0, "LEFT"),
+    "LS_LEFT": stick_shortcut(-1.0, 0.0, "LEFT"),
+    "LS_RIGHT": stick_shortcut(1.0, 0.0, "LEFT"),
+    "RS_UP": stick_shortcut(0.0, 1.0, "RIGHT"),
+    "RS_DOWN": stick_shortcut(0.0, -1.0, "RIGHT"),
+    "RS_LEFT": stick_shortcut(-1.0, 0.0, "RIGHT"),
+    "RS_RIGHT": stick_shortcut(1.0, 0.0, "RIGHT"),
+}
+
 def process_command(data, addr, player_id='player1'):
-    """Process incoming command from the Android app"""
-    data = data.strip()
+    """Process incoming command from the Android app (data is already stripped); returns reply bytes or None"""
     if not data:
         return
 
-    # Create or update connection record
-    addr_key = f"{addr[0]}:{addr[1]}"
-    if addr_key not in active_connections:
-        active_connections[addr_key] = {
+    # Create or update connection record (keyed on the (host, port) tuple)
+    now = time.monotonic()
+    conn = active_connections.get(addr)
+    if conn is None:
+        conn = active_connections[addr] = {
             'player_id': player_id,
             'addr': addr,
-            'last_seen': time.time()
+            'last_seen': now
         }
     else:
-        active_connections[addr_key]['last_seen'] = time.time()
+        conn['last_seen'] = now
 
     # 1️⃣  Strip the optional player prefix FIRST
     if data.startswith(("player1:", "player2:")):
-        player_id, data = data.split(":", 1)       # now data begins with DELTA:/TOUCHPAD:/POS:
-        active_connections[addr_key]['player_id'] = player_id
-        
-    # 🚀 NEW: handle SCROLL packets immediately
-    if data.startswith("SCROLL:"):
-        handle_scroll(data)
-        return                                         # ← nothing else to do    
-        
-         # --- LOG LEFT-CLICK PACKETS ---------------------------------
-    if data.startswith("MOUSE_LEFT"):
-        print("BTN", data)            # << add this line
-    # ------------------------------------------------------------
-
-    # 2️⃣  Route any movement packet straight to handle_touchpad()
-    if data.startswith(("DELTA:", "TOUCHPAD:", "POS:")):
-        handle_touchpad(data)
-        return                             # ← prevent duplicate work later
-
-    # 3️⃣  Everything below is for buttons / ping / register
-    if data in ["MOUSE_LEFT_DOWN", "MOUSE_LEFT_UP", "MOUSE_RIGHT_DOWN", "MOUSE_RIGHT_UP", "MOUSE_MIDDLE_DOWN", "MOUSE_MIDDLE_UP",
-                "TOUCHPAD_END", "TOUCH_END", "MOUSE_RESET"]:
-        handle_mouse_buttons(data)
-        return
-
-    # Handle heartbeat messages
-    if data == "PING":
-        return "PONG"
-    
-    # Handle connection and registration messages
-    if data.startswith("CONNECT:"):
-        try:
-            requested_id = data.split(":", 1)[1].strip()
-            if requested_id in ['player1', 'player2']:
-                player_id = requested_id
-                active_connections[addr_key]['player_id'] = player_id
-                logger.info(f"Client {addr} connected as {player_id}")
-                return f"CONNECTED:{player_id}"
-            else:
-                logger.warning(f"Invalid player ID in connection request: {requested_id}")
-                return "ERROR:invalid_player_id"
-        except Exception as e:
-            logger.error(f"Error processing connection request: {e}")
-            return "ERROR:connection_failed"
-            
-    # Handle player ID prefix in command
-    if data.startswith("REGISTER:"):
-        try:
-            requested_id = data.split(":", 1)[1].strip()
-            if requested_id in ['player1', 'player2']:
-                player_id = requested_id
-                active_connections[addr_key]['player_id'] = player_id
-                logger.info(f"Client {addr} registered as {player_id}")
-                return f"REGISTERED:{player_id}"
-            else:
-                logger.warning(f"Invalid player ID request: {requested_id}")
-                return "ERROR:invalid_player_id"
-        except Exception as e:
-            logger.error(f"Error processing registration: {e}")
-            return "ERROR:registration_failed"
-
-    # ─── Ignore keep-alive packets so taps don't fire twice ───
-    if data.startswith("KEY_SYNC:"):
-        return None
-    # ─────────────────────────────────────────────────────────
-
-    
-    # Handle key state tracking commands
-    if data.startswith("KEY_DOWN:"):
-        key = data.split(":", 1)[1]
-        handle_key_press(key, player_id)
-        return None
-        
-    if data.startswith("KEY_UP:"):
-        key = data.split(":", 1)[1]
-        handle_key_release(key, player_id)
-        return None
+        player_id, _, data = data.partition(":")   # now data begins with DELTA:/TOUCHPAD:/POS:
+        conn['player_id'] = player_id
         
+    logger.debug("Command from %s: %s", addr, data)
     
-    # Handle trigger input - both original and shortened syntax
-    if data.startswith("TRIGGER_L:"):
-        value = data.split(":", 1)[1]
-        handle_trigger_input(value, "LEFT", player_id)
-        return None
-        
-    if data.startswith("TRIGGER_R:"):
-        value = data.split(":", 1)[1]
-        handle_trigger_input(value, "RIGHT", player_id)
-        return None
-        
-    # Shortened trigger syntax
-    if data.startswith("LT:"):
-        value = data.split(":", 1)[1]
-        handle_trigger_input(value, "LEFT", player_id)
-        return None
+    # 2️⃣  "NAME:value" commands - one partition and one dict probe
+    # instead of a startswith() per command type
+    name, sep, value = data.partition(":")
+    if sep:
+        if name in REGISTRATION_REPLIES:           # CONNECT:/REGISTER:
+            return handle_registration(name, value, addr, conn)
+        handler = PREFIX_COMMANDS.get(name)
+        if handler is not None:
+            handler(data, value, player_id)
+            return None
         
-    if data.startswith("RT:"):
-        value = data.split(":", 1)[1]
-        handle_trigger_input(value, "RIGHT", player_id)
+        # Handle stick input (format: "STICK:x,y" / "LS:x,y" / "RS:x,y")
+        position = parse_position(value)
+        if position is None:
+            logger.warning(f"Invalid coordinate format from {player_id}: {value}")
+            return None
+        stick_type = STICK_COMMANDS.get(name)
+        if stick_type is None:
+            logger.warning(f"Unknown coordinate command from {player_id}: {name}")
+            return None
+        handle_stick_input(position[0], position[1], stick_type, player_id)
         return None
     
+    # 3️⃣  Exact-match commands: mouse buttons, heartbeat, stick shortcuts
+    handler = EXACT_COMMANDS.get(data)
+    if handler is not None:
+        return handler(data, player_id)
+    
     # Check for individual wait command
     if data.startswith("WAIT_"):
         handle_wait_command(data, player_id)
         return None
     
-    # Shortened stick position shortcuts
-    if data == "LS_UP":
-        handle_stick_input("0.0", "1.0", "LEFT", player_id)
-        return None
-    elif data == "LS_DOWN":
-        handle_stick_input("0.0", "-1.0", "LEFT", player_id)
-        return None
-    elif data == "LS_LEFT":
-        handle_stick_input("-1.0", "0.0", "LEFT", player_id)
-        return None
-    elif data == "LS_RIGHT":
-        handle_stick_input("1.0", "0.0", "LEFT", player_id)
-        return None
-    elif data == "RS_UP":
-        handle_stick_input("0.0", "1.0", "RIGHT", player_id)
-        return None
-    elif data == "RS_DOWN":
-        handle_stick_input("0.0", "-1.0", "RIGHT", player_id)
-        return None
-    elif data == "RS_LEFT":
-        handle_stick_input("-1.0", "0.0", "RIGHT", player_id)
-        return None
-    elif data == "RS_RIGHT":
-        handle_stick_input("1.0", "0.0", "RIGHT", player_id)
-        return None
-    
-    # Handle stick/touchpad input (format: "STICK:x,y" or "TOUCHPAD:x,y")
-    if ":" in data:
-        command, coords = data.split(":", 1)
-        if "," in coords:
-            x, y = coords.split(",", 1)
-            if command == "STICK" or command == "STICK_L" or command == "LS":
-                handle_stick_input(x, y, "LEFT", player_id)
-            elif command == "STICK_R" or command == "RS":
-                handle_stick_input(x, y, "RIGHT", player_id)
-            elif command == "TOUCHPAD":
-                handle_touchpad(data)  # Use the stability smoother version
-            elif command == "POS":  # Position data coming through UDP
-                # Handle generic position data (used by optimized clients)
-                handle_touchpad(data)  # Use the stability smoother version
-            else:
-                logger.warning(f"Unknown coordinate command from {player_id}: {command}")
-            return None
-        else:
-            logger.warning(f"Invalid coordinate format from {player_id}: {coords}")
-            return None
-    
     # Handle commands with commas (format: "W,SHIFT" or "A,WAIT_500,B")
-    elif "," in data:
+    if "," in data:
         commands = data.split(",")
         
-        # Process each command in sequence
-        threading.Thread(
-            target=process_timed_sequence, 
-            args=(commands, player_id), 
-            daemon=True
-        ).start()
-        logger.info(f"Started command sequence with {len(commands)} commands for {player_id}")
+        # Process each command in sequence - WAIT_ steps resume on the
+        # scheduler thread, so nothing sleeps here
+        process_timed_sequence(commands, player_id)
+        if INFO_ENABLED:
+            logger.info("Started command sequence with %d commands for %s", len(commands), player_id)
         return None
     
     # Handle simple button commands
@@ -821,101 +1205,449 @@ def process_command(data, addr, player_id='player1'):
         handle_button_press(data, player_id)
         return None
 
-    # Anything else just gets logged
-    logger.info(f"Command from {addr}: {data}")
-
 def clean_inactive_connections():
     """Remove connections that haven't sent data in a while"""
-    now = time.time()
+    now = time.monotonic()
     timeout = 30  # 30 seconds timeout
     
     to_remove = []
-    for addr_key, conn in active_connections.items():
+    # Snapshot the items - the command workers add connections concurrently
+    for addr, conn in list(active_connections.items()):
         if now - conn['last_seen'] > timeout:
-            to_remove.append(addr_key)
+            to_remove.append(addr)
     
-    for addr_key in to_remove:
-        logger.info(f"Removing inactive connection: {addr_key} ({active_connections[addr_key]['player_id']})")
-        del active_connections[addr_key]
+    for addr in to_remove:
+        conn = active_connections.pop(addr)
+        sender_routes.pop(addr, None)
+        logger.info(f"Removing inactive connection: {addr[0]}:{addr[1]} ({conn['player_id']})")
 
 def clean_key_states():
-    """Clean up any inconsistent keyboard states"""
+    """Re-press any key player1 is holding whose press was lost"""
+    # key_states is maintained by handle_key_press/handle_key_release, so
+    # only the held keys are checked. A lost press can only be seen by
+    # asking the OS; a key that is still down is left alone, since an
+    # extra keydown shows up as a repeat in text fields
+    for key in list(key_states['player1']):
+        try:
+            if not keyboard.is_pressed(key):
+                keyboard.press(key)
+                logger.info(f"Re-pressed key: {key}")
+        except Exception as e:
+            logger.warning(f"Error checking key state: {key} - {str(e)}")
+
+CLEANUP_INTERVAL = 10  # seconds
+
+def scheduled_cleanup():
+    """Periodic cleanup on the scheduler thread; re-arms itself"""
     try:
-        # For player1 only (since they control the keyboard)
-        if 'player1' in key_states:
-            # Check that all keys marked as pressed are actually pressed
-            for key in list(key_states['player1'].keys()):
-                try:
-                    # If key is not actually pressed according to the keyboard library
-                    if not keyboard.is_pressed(key.lower()):
-                        # Re-press it to ensure it's active
-                        keyboard.press(key.lower())
-                        logger.info(f"Re-pressed key: {key}")
-                except Exception as e:
-                    logger.warning(f"Error checking key state: {key} - {str(e)}")
-    except Exception as e:
-        logger.error(f"Error in key state cleanup: {str(e)}")
+        clean_inactive_connections()
+        clean_key_states()  # Also check key states periodically
+    finally:
+        schedule(CLEANUP_INTERVAL, scheduled_cleanup)
 
 def start_cleanup_scheduler():
     """Schedule regular cleaning of inactive connections and key states"""
-    def scheduled_cleanup():
-        while True:
-            time.sleep(10)  # Run every 10 seconds
-            clean_inactive_connections()
-            clean_key_states()  # Also check key states periodically
-            
-    cleanup_thread = threading.Thread(target=scheduled_cleanup)
-    cleanup_thread.daemon = True
-    cleanup_thread.start()
+    # Runs on the shared scheduler thread rather than a thread of its own
+    schedule(CLEANUP_INTERVAL, scheduled_cleanup)
 
-def udp_server():
-    """Run a UDP server for touchpad controls"""
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        
-        # Apply UDP-specific low-latency settings with error handling
+# One command queue per player: the receive thread only enqueues packets,
+# so a slow gamepad/keyboard call for one player never stalls recvfrom
+# or the other player's input
+command_queues = {
+    'player1': queue.SimpleQueue(),
+    'player2': queue.SimpleQueue()
+}
+
+PLAYER_PREFIXES = {b"player1:": 'player1', b"player2:": 'player2'}
+REGISTRATION_PREFIXES = (b"CONNECT:", b"REGISTER:")
+REGISTRATION_TARGETS = {player_id.encode(): player_id for player_id in VALID_PLAYER_IDS}
+
+# Player queue each sender is routed to. Only the receive thread for that
+# sender writes its entry, so a CONNECT: and the packets after it always
+# land on the same worker, in order
+sender_routes = {}
+
+def command_queue_for(data, addr):
+    """Pick the per-player queue for a raw packet, pinning the sender to it"""
+    route = sender_routes.get(addr)
+    player_id = PLAYER_PREFIXES.get(data[:8])
+    offset = 8
+    if player_id is None:
+        player_id = route or 'player1'
+        offset = 0
+    if data.startswith(REGISTRATION_PREFIXES, offset):
+        requested_id = data[offset:].partition(b":")[2].strip()
+        player_id = REGISTRATION_TARGETS.get(requested_id, player_id)
+    if player_id != route:
+        sender_routes[addr] = player_id
+    return command_queues[player_id]
+
+def touchpad_position_fast(x, y, player_id):
+    x = -1.0 if x < -1.0 else 1.0 if x > 1.0 else x
+    y = -1.0 if y < -1.0 else 1.0 if y > 1.0 else y
+    handle_touchpad_position(x, y, player_id)
+
+# "NAME:x,y" packets parsed straight from bytes -> handler(x, y, player_id)
+FAST_COORD_COMMANDS = {
+    b"DELTA": lambda x, y, player_id: move_mouse_delta(x, y),
+    b"TOUCHPAD": touchpad_position_fast,
+    b"POS": touchpad_position_fast,
+    b"STICK": lambda x, y, player_id: handle_stick_input(x, y, "LEFT", player_id),
+    b"STICK_L": lambda x, y, player_id: handle_stick_input(x, y, "LEFT", player_id),
+    b"LS": lambda x, y, player_id: handle_stick_input(x, y, "LEFT", player_id),
+    b"STICK_R": lambda x, y, player_id: handle_stick_input(x, y, "RIGHT", player_id),
+    b"RS": lambda x, y, player_id: handle_stick_input(x, y, "RIGHT", player_id),
+}
+
+# Absolute stick samples: when a run of them queues up from one sender, only
+# the newest per player/stick matters, so older ones are dropped. A sample is
+# only dropped if nothing else from that sender sits between it and the newer
+# one, so a stick+button combo still presses with the stick where it was.
+# Triggers are pulled like buttons and are never dropped, nor are DELTA
+# moves, touchpad positions or buttons.
+ANALOG_AXES = {
+    b"STICK": b"LS", b"STICK_L": b"LS", b"LS": b"LS",
+    b"STICK_R": b"RS", b"RS": b"RS",
+}
+
+def analog_axis(data):
+    """The axis an absolute analog packet sets, or None for anything else"""
+    prefix = data[:8]
+    if prefix in PLAYER_PREFIXES:
+        data = data[8:]
+    else:
+        prefix = None
+    name, sep, _ = data.partition(b":")
+    axis = ANALOG_AXES.get(name) if sep else None
+    return None if axis is None else (prefix, axis)
+
+def drop_stale_analog(packets):
+    """Drop stick samples superseded within a run of analog packets; order is kept"""
+    seen = {}       # sender -> axes with a newer sample later in its current run
+    kept = []
+    for data, addr in reversed(packets):
+        axis = analog_axis(data)
+        if axis is None:
+            seen.pop(addr, None)        # anything else ends the sender's run
+        else:
+            axes = seen.get(addr)
+            if axes is None:
+                axes = seen[addr] = set()
+            elif axis in axes:
+                continue
+            axes.add(axis)
+        kept.append((data, addr))
+    kept.reverse()
+    return kept
+
+def command_worker(sock, commands):
+    """Decode and process queued packets, sending any response back"""
+    # Bind the per-packet lookups once instead of on every iteration
+    get_packet = commands.get
+    get_pending = commands.get_nowait
+    get_conn = active_connections.get
+    sendto = sock.sendto
+    now = time.monotonic
+    _process_command = process_command
+    fast_commands = FAST_COORD_COMMANDS
+    
+    while True:
+        # Take everything that has queued up, so a backlog of stick
+        # samples collapses to the latest position
+        packets = [get_packet()]
         try:
-            # Set buffer sizes for UDP socket
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
-            logger.info("Applied UDP buffer size settings")
-        except (socket.error, OSError) as e:
-            logger.warning(f"Could not set UDP socket buffer sizes: {str(e)}")
+            while True:
+                packets.append(get_pending())
+        except queue.Empty:
+            pass
+        if len(packets) > 1:
+            packets = drop_stale_analog(packets)
         
-        sock.bind((HOST, PORT))
-        logger.info(f"UDP server started on {HOST}:{PORT}")
+        for data, addr in packets:
+            try:
+                # Determine player ID - either from stored connection or default to player1
+                conn = get_conn(addr)
+                player_id = conn['player_id'] if conn is not None else 'player1'
+            
+                # Coordinate packets (DELTA/POS/TOUCHPAD/sticks) are the
+                # highest-rate text packets: parse them straight from bytes,
+                # skipping decode and process_command (known senders only, so
+                # the connection record already exists)
+                if conn is not None:
+                    prefixed = PLAYER_PREFIXES.get(data[:8])
+                    name, sep, coords = (data if prefixed is None else data[8:]).partition(b":")
+                    fast = fast_commands.get(name) if sep else None
+                    if fast is not None:
+                        conn['last_seen'] = now()
+                        if prefixed is not None:
+                            player_id = conn['player_id'] = prefixed
+                        x, _, y = coords.partition(b",")
+                        try:
+                            x = float(x)
+                            y = float(y)
+                        except ValueError:
+                            logger.warning(f"Bad coordinate packet: {data!r}")
+                            continue
+                        fast(x, y, player_id)
+                        continue
+            
+                decoded_data = data.decode('utf-8').strip()
+                response = _process_command(decoded_data, addr, player_id)
+            
+                if response:
+                    sendto(response, addr)
+                
+            except UnicodeDecodeError:
+                logger.warning(f"Received invalid data from {addr}")
+            except Exception as e:
+                logger.error(f"Error processing command from {addr}: {e}")
         
-        # Set up a housekeeping timer for cleaning inactive connections
-        housekeeping_timer = threading.Timer(10.0, clean_inactive_connections)
-        housekeeping_timer.daemon = True
-        housekeeping_timer.start()
+        try:
+            flush_mouse_move()
+        except Exception as e:
+            logger.error(f"Mouse move failed: {e}")
+
+def start_command_workers(sock):
+    """Start one command worker thread per player queue"""
+    for player_id, commands in command_queues.items():
+        worker = threading.Thread(
+            target=command_worker,
+            args=(sock, commands),
+            name=f"commands-{player_id}",
+            daemon=True
+        )
+        worker.start()
+
+# ---------------------------------------------------------------------------
+# recvmmsg(2) batch receive (Linux). Pulls up to RECV_BATCH datagrams per
+# syscall instead of one recvfrom per packet; other platforms keep the
+# recvfrom drain loop.
+# ---------------------------------------------------------------------------
+RECV_BATCH = 64
+RECV_BUFLEN = 1024
+MSG_DONTWAIT = 0x40
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class msghdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(iovec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", msghdr), ("msg_len", ctypes.c_uint)]
+
+class sockaddr_in(ctypes.Structure):
+    _fields_ = [("sin_family", ctypes.c_ushort), ("sin_port", ctypes.c_uint16),
+                ("sin_addr", ctypes.c_uint8 * 4), ("sin_zero", ctypes.c_uint8 * 8)]
+
+def load_recvmmsg():
+    """Return libc's recvmmsg, or None where it isn't available"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint,
+                         ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+class BatchReceiver:
+    """Preallocated recvmmsg buffers for one IPv4 UDP socket"""
+    def __init__(self, sock, recvmmsg, batch=RECV_BATCH, buflen=RECV_BUFLEN):
+        self.fd = sock.fileno()
+        self.recvmmsg = recvmmsg
+        self.batch = batch
+        self.buffers = [bytearray(buflen) for _ in range(batch)]
+        self.views = [memoryview(buf) for buf in self.buffers]
+        self.names = (sockaddr_in * batch)()
+        self.iovecs = (iovec * batch)()
+        self.headers = (mmsghdr * batch)()
+        self.addr_cache = {}
+        
+        name_len = ctypes.sizeof(sockaddr_in)
+        for i, buf in enumerate(self.buffers):
+            c_buf = (ctypes.c_char * buflen).from_buffer(buf)
+            self.iovecs[i].iov_base = ctypes.addressof(c_buf)
+            self.iovecs[i].iov_len = buflen
+            hdr = self.headers[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self.names[i])
+            hdr.msg_namelen = name_len
+            hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            hdr.msg_iovlen = 1
+        self.name_len = name_len
+    
+    def receive(self):
+        """Return the queued (data, addr) pairs, or [] once the socket is drained"""
+        count = self.recvmmsg(self.fd, self.headers, self.batch, MSG_DONTWAIT, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, os.strerror(err))
         
+        packets = []
+        headers, names, views, cache = self.headers, self.names, self.views, self.addr_cache
+        for i in range(count):
+            hdr = headers[i]
+            name = names[i]
+            key = (bytes(name.sin_addr), name.sin_port)
+            addr = cache.get(key)
+            if addr is None:
+                addr = cache[key] = (socket.inet_ntoa(key[0]), socket.ntohs(key[1]))
+            packets.append((bytes(views[i][:hdr.msg_len]), addr))
+            hdr.msg_hdr.msg_namelen = self.name_len   # reset for the next call
+        return packets
+
+# Receive sockets sharing the UDP port via SO_REUSEPORT. The kernel hashes
+# each client's address onto one socket, so per-client ordering holds.
+UDP_RECEIVE_SHARDS = min(os.cpu_count() or 1, 4) if hasattr(socket, "SO_REUSEPORT") else 1
+
+def check_port_free():
+    """Raise EADDRINUSE if another process already holds the UDP port"""
+    # The shards set SO_REUSEPORT, which would let a second server started
+    # by mistake bind alongside this one and silently take part of the
+    # traffic. A plain bind first turns that into a startup error.
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        probe.bind((HOST, PORT))
+    finally:
+        probe.close()
+
+def open_udp_socket():
+    """Create and bind one UDP receive socket"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    
+    # Apply UDP-specific low-latency settings with error handling
+    try:
+        # Set buffer sizes for UDP socket
+        rcvbuf = set_socket_buffers(sock)
+        logger.debug("Applied UDP buffer size settings (SO_RCVBUF=%d)", rcvbuf)
+    except (socket.error, OSError) as e:
+        logger.warning(f"Could not set UDP socket buffer sizes: {str(e)}")
+    
+    # Let the other receive shards bind the same port (Linux/BSD)
+    if hasattr(socket, "SO_REUSEPORT"):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except OSError as e:
+            logger.warning(f"Could not set SO_REUSEPORT: {str(e)}")
+    
+    sock.bind((HOST, PORT))
+    return sock
+
+# A modest boost, not a real-time class: the receive threads still need the
+# GIL from the command workers, and a busy drain loop at real-time priority
+# could starve those workers or the game running on the same PC
+THREAD_PRIORITY_ABOVE_NORMAL = 1
+RECEIVE_THREAD_NICE = -5
+
+def raise_thread_priority():
+    """Best-effort: run the calling receive thread ahead of normal threads"""
+    try:
+        if sys.platform == "win32":
+            kernel32 = ctypes.windll.kernel32
+            if not kernel32.SetThreadPriority(kernel32.GetCurrentThread(),
+                                              THREAD_PRIORITY_ABOVE_NORMAL):
+                raise ctypes.WinError()
+        elif sys.platform.startswith("linux"):
+            # Linux applies a PRIO_PROCESS nice value of pid 0 to the calling
+            # thread only; a negative value needs CAP_SYS_NICE
+            os.setpriority(os.PRIO_PROCESS, 0, RECEIVE_THREAD_NICE)
+        else:
+            return
+        logger.debug("Raised priority of %s", threading.current_thread().name)
+    except OSError as e:
+        logger.debug("Could not raise receive thread priority: %s", e)
+
+# Windows fails recvfrom() with WSAEMSGSIZE for a datagram larger than the
+# buffer (the datagram is discarded); that only loses that one packet
+WSAEMSGSIZE = 10040
+
+def is_datagram_error(e):
+    """True for receive errors that only affect the current datagram"""
+    return e.errno in (errno.EMSGSIZE, WSAEMSGSIZE) or getattr(e, "winerror", None) == WSAEMSGSIZE
+
+def receive_loop(sock):
+    """Receive datagrams on one socket and hand them to the command queues"""
+    # This thread only receives; decoding and processing happen on the
+    # command workers. Wait for readiness, then drain every queued
+    # datagram without blocking. Errors that only affect one datagram are
+    # logged and skipped; anything else is a socket failure and propagates.
+    raise_thread_priority()
+    sock.setblocking(False)
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    wait_readable = selector.select
+    queue_for = command_queue_for
+    
+    recvmmsg = load_recvmmsg()
+    if recvmmsg is not None:
+        receive_batch = BatchReceiver(sock, recvmmsg).receive
+        while True:
+            wait_readable()
+            packets = receive_batch()
+            while packets:
+                for data, addr in packets:
+                    queue_for(data, addr).put_nowait((data, addr))
+                packets = receive_batch()
+    
+    recvfrom = sock.recvfrom
+    while True:
+        wait_readable()
         while True:
             try:
-                data, addr = sock.recvfrom(1024)
-                
-                try:
-                    decoded_data = data.decode('utf-8').strip()
-                    
-                    # Determine player ID - either from stored connection or default to player1
-                    addr_key = f"{addr[0]}:{addr[1]}"
-                    player_id = active_connections.get(addr_key, {}).get('player_id', 'player1')
-                    
-                    response = process_command(decoded_data, addr, player_id)
-                    
-                    if response:
-                        sock.sendto(response.encode('utf-8'), addr)
-                        
-                except UnicodeDecodeError:
-                    logger.warning(f"Received invalid data from {addr}")
-                    
-            except Exception as e:
-                logger.error(f"Error in UDP server: {e}")
+                data, addr = recvfrom(1024)
+            except BlockingIOError:
+                break       # drained - back to waiting
+            except ConnectionResetError:
+                continue    # Windows reports an earlier sendto's ICMP port-unreachable here
+            except OSError as e:
+                if not is_datagram_error(e):
+                    raise
+                logger.warning(f"Dropped unreadable datagram: {e}")
+                continue
+            queue_for(data, addr).put_nowait((data, addr))
+
+def receive_shard(sock):
+    """Thread entry for the extra receive shards"""
+    try:
+        receive_loop(sock)
+    except Exception as e:
+        logger.error(f"Fatal error in UDP receive shard: {e}")
+
+def udp_server():
+    """Run a UDP server for touchpad controls"""
+    sockets = []
+    try:
+        if hasattr(socket, "SO_REUSEPORT"):
+            check_port_free()
+        for _ in range(UDP_RECEIVE_SHARDS):
+            sockets.append(open_udp_socket())
+        sock = sockets[0]
+        rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        logger.info(f"UDP server started on {HOST}:{PORT} "
+                    f"({len(sockets)} receive socket(s), SO_RCVBUF={rcvbuf})")
+        if load_recvmmsg() is not None:
+            logger.info(f"Using recvmmsg batch receive ({RECV_BATCH} datagrams per call)")
+        
+        # Replies go out through the first socket - every shard shares the port
+        start_command_workers(sock)
+        
+        for shard in sockets[1:]:
+            threading.Thread(target=receive_shard, args=(shard,), daemon=True).start()
+        receive_loop(sock)
                 
     except Exception as e:
         logger.error(f"Fatal error in UDP server: {e}")
     finally:
-        sock.close()
+        for sock in sockets:
+            sock.close()
         logger.info("UDP server stopped")
 
 if __name__ == "__main__":
@@ -929,6 +1661,12 @@ if __name__ == "__main__":
         # Start the connection cleanup scheduleraaaaa
         start_cleanup_scheduler()
         
+        # Everything built at startup (tables, gamepads, threads) lives for
+        # the whole run; move it out of the collector's reach so GC passes
+        # during input only scan objects created since
+        gc.collect()
+        gc.freeze()
+        
         # Start the UDP server
         udp_server()
         
@@ -940,5 +1678,7 @@ if __name__ == "__main__":
     finally:
         print("Server stopped")
         logger.info("Server stopped")
+        log_listener.stop()
+        file_buffer.flush()
         
     input("Press Enter to exit...")